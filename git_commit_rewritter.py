@@ -2,175 +2,748 @@
 
 import subprocess
 import argparse
+import contextlib
+import io
 import random
+import shutil
 import sys
 import os
-from datetime import datetime, timedelta
-from typing import List, Dict
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta, timezone
+from typing import Iterator, List, Dict, Tuple
+
+try:
+    import pygit2  # optional in-process git bindings; subprocess otherwise
+except ImportError:
+    pygit2 = None
 
 
 class GitCommitRewriter:
+    # Above this many commits the generated case script gets big enough that
+    # re-parsing it in every per-commit shell outweighs a grep lookup, so the
+    # mapping moves into a keyed file instead
+    DATE_MAP_THRESHOLD = 1000
+
     def __init__(self, start_date: str, end_date: str, repo_path: str = ".",
                  work_start: str = "09:00", work_end: str = "17:00", jitter_minutes: int = 15,
                  author_name: str = None, author_email: str = None):
         
-        self.start_date = datetime.strptime(start_date, "%Y-%m-%d")
-        self.end_date = datetime.strptime(end_date, "%Y-%m-%d")
+        # fromisoformat and plain int parsing skip the per-call format
+        # compilation that makes strptime slow
+        self.start_date = datetime.fromisoformat(start_date)
+        self.end_date = datetime.fromisoformat(end_date)
         self.repo_path = os.path.abspath(repo_path)
-        self.work_start = datetime.strptime(work_start, "%H:%M").time()
-        self.work_end = datetime.strptime(work_end, "%H:%M").time()
+        self.work_start = time(*map(int, work_start.split(":")))
+        self.work_end = time(*map(int, work_end.split(":")))
         self.jitter_minutes = jitter_minutes
         self.author_name = author_name
         self.author_email = author_email
 
+        # Lazily populated probe result, so repeated operations on the same
+        # instance don't re-spawn git for answers that can't change
+        self._repo_probe = None
+
+        # Long-lived cat-file --batch process, opened on first object read
+        # and reused for every later one; close() (or the context manager)
+        # shuts it down
+        self._batch_proc = None
+
+        # In-process repository handle when pygit2 is installed; the
+        # read-heavy lookups then skip fork+exec entirely
+        self._pygit_repo = None
+        if pygit2 is not None:
+            try:
+                self._pygit_repo = pygit2.Repository(self.repo_path)
+            except pygit2.GitError:
+                self._pygit_repo = None
+
+        # Built once and reused for every git subprocess; LC_ALL=C skips
+        # locale processing inside git, GIT_OPTIONAL_LOCKS=0 avoids
+        # contention on optional lock files, and squelching the
+        # filter-branch banner removes its multi-second startup delay
+        self._env = {
+            **os.environ,
+            "LC_ALL": "C",
+            "GIT_OPTIONAL_LOCKS": "0",
+            "FILTER_BRANCH_SQUELCH_WARNING": "1",
+        }
+
         if self.start_date >= self.end_date:
             raise ValueError("Start date must be before end date")
-        if not os.path.exists(self.repo_path):
+        if not os.path.isdir(self.repo_path):
             raise ValueError(f"Repository path does not exist: {self.repo_path}")
 
+        date_range = (self.end_date - self.start_date).days
+        self._weekday_offsets = [d for d in range(date_range + 1)
+                                 if (self.start_date + timedelta(days=d)).weekday() < 5]
+        if not self._weekday_offsets:
+            raise ValueError("Date range contains no weekdays")
+
+        self._work_start_minutes = self.work_start.hour * 60 + self.work_start.minute
+        self._work_end_minutes = self.work_end.hour * 60 + self.work_end.minute
+
     def _run_git_command(self, cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
-        return subprocess.run(cmd, cwd=self.repo_path, **kwargs)
+        # git -C keeps the child on the parent's cwd (no chdir per spawn)
+        # while still resolving everything against the target repo
+        return subprocess.run(["git", "-C", self.repo_path] + cmd[1:], env=self._env, **kwargs)
+
+    def _probe_repo(self):
+        if self._repo_probe is None and self._pygit_repo is not None:
+            repo = self._pygit_repo
+            if repo.head_is_detached or repo.head_is_unborn:
+                self._repo_probe = (repo.path, "")
+            else:
+                self._repo_probe = (repo.path, repo.head.shorthand)
+
+        if self._repo_probe is None:
+            try:
+                result = self._run_git_command(
+                    ["git", "rev-parse", "--git-dir", "--abbrev-ref", "HEAD"],
+                    check=True, capture_output=True, text=True
+                )
+                output = result.stdout
+                resolved_head = True
+            except subprocess.CalledProcessError as e:
+                # A repo with no commits yet still prints its git dir, even
+                # though resolving HEAD makes rev-parse exit non-zero
+                output = e.stdout or ""
+                resolved_head = False
+
+            lines = output.strip().split('\n') if output.strip() else []
+            if lines:
+                branch = lines[1] if resolved_head and len(lines) > 1 else ""
+                if branch == "HEAD":
+                    # --abbrev-ref prints the literal string HEAD when
+                    # detached; report no branch, like the pygit2 probe's
+                    # head_is_detached path, so callers fall back to
+                    # updating HEAD itself rather than a branch named HEAD
+                    branch = ""
+                self._repo_probe = (lines[0], branch)
+            else:
+                self._repo_probe = ()
+        return self._repo_probe or None
 
     def check_git_repo(self) -> bool:
-        try:
-            self._run_git_command(["git", "rev-parse", "--git-dir"], check=True, capture_output=True)
+        # A .git directory answers the common layout with one stat and no
+        # subprocess; worktrees and bare repos fall through to the probe,
+        # which also stays the source of truth once it has run
+        if self._repo_probe is None and os.path.isdir(os.path.join(self.repo_path, ".git")):
             return True
-        except subprocess.CalledProcessError:
-            return False
-
-    def get_recent_commits(self, count: int = None) -> List[str]:
-        try:
-            cmd = ["git", "log", "--format=%H"]
-            if count is not None:
-                cmd.insert(2, f"--max-count={count}")
-            
-            result = self._run_git_command(cmd, check=True, capture_output=True, text=True)
-            return result.stdout.strip().split('\n') if result.stdout.strip() else []
-        except subprocess.CalledProcessError:
-            return []
-
-    def generate_random_work_datetime(self) -> datetime:
-        date_range = (self.end_date - self.start_date).days
-        random_days = random.randint(0, date_range)
-        random_date = self.start_date + timedelta(days=random_days)
+        return self._probe_repo() is not None
+
+    def get_current_branch(self) -> str:
+        probe = self._probe_repo()
+        return probe[1] if probe else ""
+
+    def _batch_read_commit(self, commit_hash: str) -> bytes:
+        if self._batch_proc is None or self._batch_proc.poll() is not None:
+            self._batch_proc = subprocess.Popen(
+                ["git", "-C", self.repo_path, "cat-file", "--batch"],
+                env=self._env,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
 
-        while random_date.weekday() >= 5:
-            random_date = self.start_date + timedelta(days=random.randint(0, date_range))
+        self._batch_proc.stdin.write(commit_hash.encode() + b"\n")
+        self._batch_proc.stdin.flush()
+
+        header = self._batch_proc.stdout.readline().split()
+        if len(header) != 3 or header[1] != b"commit":
+            raise subprocess.CalledProcessError(1, ["git", "cat-file", "--batch"])
+        raw = self._batch_proc.stdout.read(int(header[2]))
+        self._batch_proc.stdout.read(1)  # trailing newline after the payload
+        return raw
+
+    def close(self):
+        if self._batch_proc is not None:
+            self._batch_proc.stdin.close()
+            self._batch_proc.wait()
+            self._batch_proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _invalidate_cache(self):
+        self._repo_probe = None
+
+    def get_recent_commits(self, count: int = None) -> Iterator[str]:
+        if self._pygit_repo is not None:
+            try:
+                target = self._pygit_repo.head.target
+            except pygit2.GitError:
+                return
+            for i, commit in enumerate(self._pygit_repo.walk(target, pygit2.GIT_SORT_TOPOLOGICAL)):
+                if count is not None and i >= count:
+                    break
+                yield str(commit.id)
+            return
+
+        # --topo-order guarantees children before parents even under clock
+        # skew, which the plumbing rewrite's parent remapping relies on
+        cmd = ["git", "-C", self.repo_path, "log", "--topo-order", "--format=%H"]
+        if count is not None:
+            cmd.insert(4, f"--max-count={count}")
 
-        work_start_minutes = self.work_start.hour * 60 + self.work_start.minute
-        work_end_minutes = self.work_end.hour * 60 + self.work_end.minute
-        random_minutes = random.randint(work_start_minutes, work_end_minutes)
+        try:
+            process = subprocess.Popen(
+                cmd, env=self._env,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            )
+        except OSError:
+            return
+
+        # Stream hashes as git produces them instead of buffering the whole
+        # log output; callers materialize a list only where they need one
+        with process:
+            for line in process.stdout:
+                commit_hash = line.strip()
+                if commit_hash:
+                    yield commit_hash
+
+    def get_recent_commits_with_dates(self, count: int = None) -> Iterator[Tuple[str, datetime]]:
+        # The listing and the original-date read come from the same walk, so
+        # one git log answers both instead of a second per-hash lookup pass
+        if self._pygit_repo is not None:
+            try:
+                target = self._pygit_repo.head.target
+            except pygit2.GitError:
+                return
+            for i, commit in enumerate(self._pygit_repo.walk(target, pygit2.GIT_SORT_TOPOLOGICAL)):
+                if count is not None and i >= count:
+                    break
+                author_tz = timezone(timedelta(minutes=commit.author.offset))
+                yield str(commit.id), datetime.fromtimestamp(commit.author.time, author_tz)
+            return
+
+        cmd = ["git", "-C", self.repo_path, "log", "--topo-order", "--format=%H %aI"]
+        if count is not None:
+            cmd.insert(4, f"--max-count={count}")
 
-        jitter = random.randint(-self.jitter_minutes, self.jitter_minutes)
-        random_minutes = max(work_start_minutes, min(work_end_minutes, random_minutes + jitter))
+        try:
+            process = subprocess.Popen(
+                cmd, env=self._env,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            )
+        except OSError:
+            return
+
+        with process:
+            for line in process.stdout:
+                parts = line.split()
+                if len(parts) == 2:
+                    try:
+                        yield parts[0], datetime.fromisoformat(parts[1])
+                    except ValueError:
+                        continue
+
+    def get_commit_original_dates(self, commits: List[str]) -> Dict[str, datetime]:
+        if not commits:
+            return {}
+
+        if self._pygit_repo is not None:
+            original_dates = {}
+            for commit_hash in commits:
+                try:
+                    commit = self._pygit_repo[commit_hash]
+                except (KeyError, ValueError):
+                    continue
+                author_tz = timezone(timedelta(minutes=commit.author.offset))
+                original_dates[commit_hash] = datetime.fromtimestamp(commit.author.time, author_tz)
+            return original_dates
+
+        # One stdin-fed git process answers every lookup; a git show per
+        # commit would cost N fork+execs for the same data
+        try:
+            process = subprocess.Popen(
+                ["git", "-C", self.repo_path, "log", "--no-walk=unsorted", "--format=%H %aI", "--stdin"],
+                env=self._env,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True
+            )
+        except OSError:
+            return {}
 
-        random_hour = random_minutes // 60
-        random_minute = random_minutes % 60
+        output, _ = process.communicate('\n'.join(commits) + '\n')
 
-        return random_date.replace(hour=random_hour, minute=random_minute, second=0, microsecond=0)
+        original_dates = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 2:
+                try:
+                    original_dates[parts[0]] = datetime.fromisoformat(parts[1])
+                except ValueError:
+                    continue
+        return original_dates
 
-    def build_env_filter_script(self, commit_date_map: Dict[str, datetime], total_commits: int) -> str:
-        progress_file = os.path.join(self.repo_path, ".git", "rewrite_progress")
-        
-        script_parts = [
-            f'PROGRESS_FILE="{progress_file}"',
-            f'TOTAL_COMMITS={total_commits}',
-            '',
-            'if [ ! -f "$PROGRESS_FILE" ]; then',
-            '    echo "0" > "$PROGRESS_FILE"',
-            'fi',
-            'CURRENT_COUNT=$(cat "$PROGRESS_FILE")',
-            'CURRENT_COUNT=$((CURRENT_COUNT + 1))',
-            'echo "$CURRENT_COUNT" > "$PROGRESS_FILE"',
-            '',
-            '# Progress bar',
-            'BAR_WIDTH=30',
-            'FILLED=$((CURRENT_COUNT * BAR_WIDTH / TOTAL_COMMITS))',
-            'BAR=$(printf "%0.s#" $(seq 1 $FILLED))',
-            'EMPTY=$((BAR_WIDTH - FILLED))',
-            'BAR="$BAR$(printf "%0.s-" $(seq 1 $EMPTY))"',
-            'PERCENT=$((CURRENT_COUNT * 100 / TOTAL_COMMITS))',
-            'printf "\\r[%s] %d%% (%d/%d)" "$BAR" "$PERCENT" "$CURRENT_COUNT" "$TOTAL_COMMITS" > /dev/tty',
-            '',
-            'if [ "$CURRENT_COUNT" -eq "$TOTAL_COMMITS" ]; then',
-            '    printf "\\n" > /dev/tty',
-            '    rm -f "$PROGRESS_FILE"',
-            'fi',
-            '',
-            '# Commit date mapping'
-        ]
-        
-        for i, (commit_hash, new_date) in enumerate(commit_date_map.items()):
-            git_date = new_date.strftime("%Y-%m-%d %H:%M:%S")
-            condition = "if" if i == 0 else "elif"
-            
-            script_parts.append(f'{condition} [ "$GIT_COMMIT" = "{commit_hash}" ]; then')
-            script_parts.append(f'    export GIT_AUTHOR_DATE="{git_date}"')
-            script_parts.append(f'    export GIT_COMMITTER_DATE="{git_date}"')
-            
+    def generate_random_work_datetime(self) -> datetime:
+        return self.generate_random_work_datetimes(1)[0]
+
+    def generate_random_work_datetimes(self, count: int) -> List[datetime]:
+        return [self.start_date + timedelta(minutes=offset)
+                for offset in self._draw_work_minute_offsets(count)]
+
+    def _draw_work_minute_offsets(self, count: int) -> List[int]:
+        # Each draw is a plain minute offset from start_date, so consumers
+        # can sort and compare ints instead of datetime objects
+        work_start_minutes = self._work_start_minutes
+        work_end_minutes = self._work_end_minutes
+
+        offsets = []
+        for day_offset in random.choices(self._weekday_offsets, k=count):
+            random_minutes = random.randint(work_start_minutes, work_end_minutes)
+            jitter = random.randint(-self.jitter_minutes, self.jitter_minutes)
+            random_minutes = max(work_start_minutes, min(work_end_minutes, random_minutes + jitter))
+
+            offsets.append(day_offset * 1440 + random_minutes)
+        return offsets
+
+    def build_env_filter_script(self, commit_date_map: Dict[str, datetime], progress_fifo: str = None,
+                                date_map_path: str = None) -> str:
+        # The author exports are identical for every rewritten commit, so
+        # define them once in a function and call it from matched branches;
+        # hoisting the exports themselves to the top would also re-author
+        # commits that filter-branch visits but that aren't being rewritten
+        author_function = ""
+        author_call = ""
+        if self.author_name or self.author_email:
+            function_lines = ['set_author() {']
             if self.author_name:
-                script_parts.append(f'    export GIT_AUTHOR_NAME="{self.author_name}"')
-                script_parts.append(f'    export GIT_COMMITTER_NAME="{self.author_name}"')
-            
+                function_lines.append(f'    export GIT_AUTHOR_NAME="{self.author_name}"')
+                function_lines.append(f'    export GIT_COMMITTER_NAME="{self.author_name}"')
             if self.author_email:
-                script_parts.append(f'    export GIT_AUTHOR_EMAIL="{self.author_email}"')
-                script_parts.append(f'    export GIT_COMMITTER_EMAIL="{self.author_email}"')
-        
-        script_parts.append('fi')
-        return '\n'.join(script_parts)
+                function_lines.append(f'    export GIT_AUTHOR_EMAIL="{self.author_email}"')
+                function_lines.append(f'    export GIT_COMMITTER_EMAIL="{self.author_email}"')
+            function_lines.append('}')
+            author_function = '\n'.join(function_lines) + '\n\n'
+            author_call = '    set_author\n'
+
+        # One atomic short write per rewritten commit; the parent renders the
+        # bar. Emitted inside the matched branch so commits that filter-branch
+        # merely visits don't inflate the count.
+        progress_line = f'    echo "$GIT_COMMIT" >> "{progress_fifo}"\n' if progress_fifo else ""
+
+        buf = io.StringIO()
+        buf.write(author_function)
+
+        if date_map_path:
+            # Huge maps: the mapping lives in a keyed file, so the script the
+            # per-commit shell has to parse stays a few lines regardless of N
+            buf.write('# Commit date lookup\n')
+            buf.write(f'NEW_DATE=$(grep -m 1 "^$GIT_COMMIT " "{date_map_path}" | cut -d" " -f2-)\n')
+            buf.write('if [ -n "$NEW_DATE" ]; then\n')
+            buf.write('    export GIT_AUTHOR_DATE="$NEW_DATE"\n')
+            buf.write('    export GIT_COMMITTER_DATE="$NEW_DATE"\n')
+            buf.write(author_call)
+            buf.write(progress_line)
+            buf.write('fi')
+            return buf.getvalue()
+
+        buf.write('# Commit date mapping\n')
+
+        # case dispatch so each per-commit shell does a single pattern match
+        # instead of walking an O(N) if/elif chain
+        buf.write('case "$GIT_COMMIT" in\n')
+        for commit_hash, new_date in commit_date_map.items():
+            # Same "YYYY-MM-DD HH:MM:SS" text as strftime, minus its
+            # per-call format interpretation
+            git_date = new_date.isoformat(sep=" ", timespec="seconds")
+
+            # Dates never contain quoting metacharacters, so single-quoted
+            # literals let the per-commit shell skip expansion scanning
+            buf.write(f"{commit_hash})\n"
+                      f"    export GIT_AUTHOR_DATE='{git_date}'\n"
+                      f"    export GIT_COMMITTER_DATE='{git_date}'\n")
+            buf.write(author_call)
+            buf.write(progress_line)
+            buf.write('    ;;\n')
+
+        buf.write('esac')
+        return buf.getvalue()
+
+    def _build_commit_date_map(self, commits: List[str]) -> Dict[str, datetime]:
+        offsets = self._draw_work_minute_offsets(len(commits))
+        offsets.sort()
+
+        # commits arrive newest first, so pair them with the offsets in
+        # descending order
+        return {commit_hash: self.start_date + timedelta(minutes=offset)
+                for commit_hash, offset in zip(commits, reversed(offsets))}
+
+    def _raw_git_date(self, new_date: datetime) -> str:
+        # Raw fast-import date format: "<unix timestamp> <tz offset>"
+        local_date = new_date.astimezone()
+        return f"{int(local_date.timestamp())} {local_date.strftime('%z')}"
+
+    def build_commit_callback_source(self, commit_date_map: Dict[str, datetime]) -> str:
+        callback_lines = ["dates = {"]
+
+        for commit_hash, new_date in commit_date_map.items():
+            callback_lines.append(f'    b"{commit_hash}": b"{self._raw_git_date(new_date)}",')
+
+        callback_lines.extend([
+            "}",
+            "new_date = dates.get(commit.original_id)",
+            "if new_date is not None:",
+            "    commit.author_date = new_date",
+            "    commit.committer_date = new_date",
+        ])
+
+        if self.author_name:
+            callback_lines.append(f'    commit.author_name = b"{self.author_name}"')
+            callback_lines.append(f'    commit.committer_name = b"{self.author_name}"')
+
+        if self.author_email:
+            callback_lines.append(f'    commit.author_email = b"{self.author_email}"')
+            callback_lines.append(f'    commit.committer_email = b"{self.author_email}"')
+
+        return '\n'.join(callback_lines)
 
     def rewrite_commits(self, commit_count: int = None, create_backup: bool = True) -> bool:
         if not self.check_git_repo():
             print(f"Error: Not a Git repository: {self.repo_path}")
             return False
 
-        commits = self.get_recent_commits(commit_count)
-        if not commits:
+        commits_with_dates = list(self.get_recent_commits_with_dates(commit_count))
+        if not commits_with_dates:
             print("No commits found to rewrite")
             return False
 
-        print(f"Found {len(commits)} commits to rewrite")
+        commits = [commit_hash for commit_hash, _ in commits_with_dates]
+        original_dates = dict(commits_with_dates)
 
-        if create_backup:
-            self._create_backup()
-
-        new_dates = [self.generate_random_work_datetime() for _ in range(len(commits))]
-        new_dates.sort()
+        print(f"Found {len(commits)} commits to rewrite")
 
-        commit_date_map = {}
-        for i, commit_hash in enumerate(commits):
-            date_index = len(commits) - 1 - i
-            commit_date_map[commit_hash] = new_dates[date_index]
+        # The backup is a subprocess wait while date generation is pure
+        # Python, so let them overlap; the backup must exist before the
+        # rewrite itself starts
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            backup_future = executor.submit(self._create_backup) if create_backup else None
+            commit_date_map = self._build_commit_date_map(commits)
+            if backup_future is not None:
+                backup_future.result()
+
+        # Cap the plan printout so huge --all runs don't stall on terminal IO
+        plan_limit = 20
+        for commit_hash, new_date in list(commit_date_map.items())[:plan_limit]:
+            original = original_dates.get(commit_hash)
+            original_str = original.strftime("%Y-%m-%d %H:%M") if original else "unknown"
+            print(f"  {commit_hash[:8]}: {original_str} -> {new_date.strftime('%Y-%m-%d %H:%M')}")
+        if len(commit_date_map) > plan_limit:
+            print(f"  ... and {len(commit_date_map) - plan_limit} more")
 
-        env_filter_script = self.build_env_filter_script(commit_date_map, len(commits))
-        
-        # Clean up any existing progress file
-        progress_file = os.path.join(self.repo_path, ".git", "rewrite_progress")
-        if os.path.exists(progress_file):
-            os.remove(progress_file)
-        
         print("Rewriting commits...")
         try:
-            self._run_git_command(
-                ["git", "filter-branch", "-f", "--env-filter", env_filter_script],
-                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True
-            )
+            self._rewrite(commit_date_map, len(commits))
             print(f"Successfully rewrote {len(commits)} commits!")
+            self._invalidate_cache()
             return True
         except subprocess.CalledProcessError as e:
             print(f"\nError during rewrite: {e}")
-            # Clean up progress file on error
-            if os.path.exists(progress_file):
-                os.remove(progress_file)
             return False
+        finally:
+            self.close()
+
+    @staticmethod
+    def _patch_ident_line(line: bytes, raw_date: bytes, author_name: bytes, author_email: bytes) -> bytes:
+        tag, ident = line.split(b" ", 1)
+        ident = ident[:ident.rindex(b">") + 1]
+        name, _, email = ident[:-1].rpartition(b" <")
+
+        if author_name is not None:
+            name = author_name
+        if author_email is not None:
+            email = author_email
+
+        return tag + b" " + name + b" <" + email + b"> " + raw_date + b"\n"
+
+    def rewrite_via_fast_export(self, commit_date_map: Dict[str, datetime]):
+        raw_dates = {commit_hash.encode(): self._raw_git_date(new_date).encode()
+                     for commit_hash, new_date in commit_date_map.items()}
+        author_name = self.author_name.encode() if self.author_name else None
+        author_email = self.author_email.encode() if self.author_email else None
+
+        exporter = subprocess.Popen(
+            # Export HEAD only: --all would drag backup branches through the
+            # rewrite and re-date their copies of the targeted commits too
+            ["git", "-C", self.repo_path, "fast-export", "--signed-tags=strip", "--show-original-ids", "HEAD"],
+            env=self._env, stdout=subprocess.PIPE
+        )
+        importer = subprocess.Popen(
+            ["git", "-C", self.repo_path, "fast-import", "--force", "--quiet"],
+            env=self._env, stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
 
-    def _create_backup(self):
+        # Patch the author/committer lines of targeted commits as the export
+        # stream flows through; everything else is copied verbatim. data
+        # payloads are copied by length so commit messages can't be mistaken
+        # for stream commands.
+        stream = exporter.stdout
+        sink = importer.stdin
+        current_date = None
+
+        try:
+            line = stream.readline()
+            while line:
+                if line.startswith(b"original-oid "):
+                    current_date = raw_dates.get(line.split()[1])
+                    sink.write(line)
+                elif current_date is not None and line.startswith(b"author "):
+                    sink.write(self._patch_ident_line(line, current_date, author_name, author_email))
+                elif current_date is not None and line.startswith(b"committer "):
+                    sink.write(self._patch_ident_line(line, current_date, author_name, author_email))
+                    current_date = None
+                elif line.startswith(b"data "):
+                    sink.write(line)
+                    sink.write(stream.read(int(line.split()[1])))
+                else:
+                    sink.write(line)
+                line = stream.readline()
+
+            sink.close()
+        except OSError:
+            # fast-import dying mid-stream surfaces here as a broken pipe
+            # long before wait() would report its exit status; raise the
+            # same CalledProcessError a post-stream failure produces so the
+            # fallback chain still fires
+            with contextlib.suppress(OSError):
+                sink.close()
+            exporter.kill()
+            exporter.wait()
+            raise subprocess.CalledProcessError(importer.wait() or 1, ["git", "fast-import"])
+        export_status = exporter.wait()
+        import_status = importer.wait()
+        if export_status:
+            raise subprocess.CalledProcessError(export_status, ["git", "fast-export"])
+        if import_status:
+            raise subprocess.CalledProcessError(import_status, ["git", "fast-import"])
+
+    def _rewrite(self, commit_date_map: Dict[str, datetime], total_commits: int):
+        # Fastest applicable strategy first: filter-repo if installed, then
+        # the native plumbing rewrite, then the fast-export pipeline, with
+        # filter-branch as the last resort
+        if shutil.which("git-filter-repo"):
+            self._rewrite_with_filter_repo(commit_date_map)
+            return
+
+        try:
+            self._rewrite_with_commit_tree(commit_date_map)
+            return
+        except (OSError, subprocess.CalledProcessError):
+            pass
+
+        try:
+            self.rewrite_via_fast_export(commit_date_map)
+        except subprocess.CalledProcessError:
+            print("fast-export rewrite failed, falling back to filter-branch...")
+            self._rewrite_with_filter_branch(commit_date_map, total_commits)
+
+    def _rewrite_with_commit_tree(self, commit_date_map: Dict[str, datetime]):
+        """Rebuild the targeted commits directly from plumbing.
+
+        Dates and author are commit metadata, so the new commits can reuse
+        the original trees untouched: read each raw commit object, patch its
+        ident and parent lines, write it back, and finally point the branch
+        at the new tip. No history walk, no per-commit shell.
+        """
+        author_name = self.author_name.encode() if self.author_name else None
+        author_email = self.author_email.encode() if self.author_email else None
+
+        replacements = {}
+        new_tip = None
+        # The map preserves the topologically ordered newest-first listing
+        # (children strictly before parents), so walking it backwards
+        # rebuilds every parent before the commits that reference it
+        for commit_hash in reversed(list(commit_date_map)):
+            raw = self._batch_read_commit(commit_hash)
+
+            raw_date = self._raw_git_date(commit_date_map[commit_hash]).encode()
+            head, _, message = raw.partition(b"\n\n")
+
+            new_head = []
+            in_signature = False
+            for line in head.split(b"\n"):
+                if in_signature:
+                    if line.startswith(b" "):
+                        continue
+                    in_signature = False
+                if line.startswith(b"gpgsig"):
+                    # The signature covers the old metadata; drop it like
+                    # fast-export does rather than keep an invalid one
+                    in_signature = True
+                    continue
+                if line.startswith(b"parent "):
+                    parent = line[7:].decode()
+                    line = b"parent " + replacements.get(parent, parent).encode()
+                elif line.startswith(b"author ") or line.startswith(b"committer "):
+                    line = self._patch_ident_line(line + b"\n", raw_date, author_name, author_email)[:-1]
+                new_head.append(line)
+
+            result = self._run_git_command(
+                ["git", "hash-object", "-t", "commit", "-w", "--stdin"],
+                check=True, capture_output=True,
+                input=b"\n".join(new_head) + b"\n\n" + message
+            )
+            new_sha = result.stdout.decode().strip()
+            replacements[commit_hash] = new_sha
+            new_tip = new_sha
+
+        branch = self.get_current_branch()
+        ref = f"refs/heads/{branch}" if branch else "HEAD"
+        self._run_git_command(
+            ["git", "update-ref", ref, new_tip],
+            check=True, capture_output=True
+        )
+
+    def _rewrite_with_filter_repo(self, commit_date_map: Dict[str, datetime]):
+        callback_source = self.build_commit_callback_source(commit_date_map)
+        self._run_git_command(
+            # Scoped to HEAD so backup branches keep the original dates
+            # instead of being dragged through the rewrite
+            ["git", "filter-repo", "--force", "--refs", "HEAD",
+             "--commit-callback", callback_source],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True
+        )
+
+    def _report_progress(self, fifo_path: str, total_commits: int):
+        bar_width = 30
+        count = 0
+        try:
+            with open(fifo_path) as fifo:
+                for _ in fifo:
+                    count += 1
+                    filled = count * bar_width // total_commits
+                    bar = '#' * filled + '-' * (bar_width - filled)
+                    percent = count * 100 // total_commits
+                    print(f"\r[{bar}] {percent}% ({count}/{total_commits})", end="", flush=True)
+        except OSError:
+            return
+        if count:
+            print()
+
+    def _rewrite_with_filter_branch(self, commit_date_map: Dict[str, datetime], total_commits: int):
+        # Per-commit progress flows through a named pipe drained by a Python
+        # thread, replacing the old cat/echo counter file that cost disk IO
+        # and forks on every commit. The pipe lives in RAM-backed /dev/shm
+        # when available so its metadata never touches the repo filesystem,
+        # and carries the pid so concurrent runs can't collide.
+        fifo_dir = "/dev/shm" if os.path.isdir("/dev/shm") else os.path.join(self.repo_path, ".git")
+        fifo_path = os.path.join(fifo_dir, f"rewrite_progress_{os.getpid()}")
+        try:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(fifo_path)
+            os.mkfifo(fifo_path)
+        except OSError:
+            fifo_path = None
+
+        date_map_path = None
+        if len(commit_date_map) > self.DATE_MAP_THRESHOLD:
+            date_map_path = os.path.join(fifo_dir, f"rewrite_date_map_{os.getpid()}")
+            try:
+                with open(date_map_path, "w") as date_map_file:
+                    for commit_hash, new_date in commit_date_map.items():
+                        date_map_file.write(f"{commit_hash} {new_date.isoformat(sep=' ', timespec='seconds')}\n")
+            except OSError:
+                date_map_path = None
+
+        env_filter_script = self.build_env_filter_script(commit_date_map, fifo_path, date_map_path)
+
+        # Source the script from a file rather than threading the whole
+        # thing through argv — large maps would otherwise bump into the
+        # execve argument limit and get copied into every per-commit shell's
+        # command line
+        script_path = os.path.join(fifo_dir, f"rewrite_env_filter_{os.getpid()}")
+        try:
+            with open(script_path, "w") as script_file:
+                script_file.write(env_filter_script)
+            # Quoted: when /dev/shm is absent the scratch dir is inside the
+            # repo, and an unquoted path with a space would word-split into
+            # a silent no-op source under /bin/sh
+            env_filter = f'. "{script_path}"'
+        except OSError:
+            script_path = None
+            env_filter = env_filter_script
+
+        # Bound the walk to the commits actually being rewritten so
+        # filter-branch doesn't re-commit untouched ancestors; a root
+        # commit has no parent to anchor the range on, so fall back to
+        # the default full walk in that case
+        oldest = list(commit_date_map)[-1]
+        try:
+            self._run_git_command(
+                ["git", "rev-parse", "--verify", "--quiet", f"{oldest}^"],
+                check=True, capture_output=True
+            )
+            rev_range = [f"{oldest}^..HEAD"]
+        except subprocess.CalledProcessError:
+            rev_range = ["HEAD"]
+
+        progress_thread = None
+        keep_alive_fd = None
+        if fifo_path:
+            progress_thread = threading.Thread(
+                target=self._report_progress, args=(fifo_path, total_commits), daemon=True
+            )
+            progress_thread.start()
+            # Hold a writer open for the whole rewrite so the reader only
+            # sees EOF after the short-lived per-commit writers are all done
+            keep_alive_fd = os.open(fifo_path, os.O_WRONLY)
+
+        try:
+            # stderr spools to a tempfile instead of a in-memory pipe buffer;
+            # on failure only its tail is read back for diagnostics
+            with tempfile.TemporaryFile() as stderr_sink:
+                try:
+                    self._run_git_command(
+                        ["git", "filter-branch", "-f", "--env-filter", env_filter, "--"] + rev_range,
+                        check=True, stdout=subprocess.DEVNULL, stderr=stderr_sink, text=True
+                    )
+                except subprocess.CalledProcessError:
+                    size = stderr_sink.seek(0, io.SEEK_END)
+                    stderr_sink.seek(max(0, size - 2048))
+                    tail = stderr_sink.read().decode(errors="replace").strip()
+                    if tail:
+                        print(f"\nfilter-branch: {tail}", file=sys.stderr)
+                    raise
+        finally:
+            if keep_alive_fd is not None:
+                os.close(keep_alive_fd)
+                progress_thread.join(timeout=5)
+            if fifo_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(fifo_path)
+            if date_map_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(date_map_path)
+            if script_path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(script_path)
+
+    def clean_filter_branch_refs(self):
+        # Optional post-rewrite housekeeping: drop the refs/original backups
+        # filter-branch leaves behind and let gc prune the old objects. Plain
+        # gc only — --aggressive would repack every delta in the repository
+        # and usually dominates the rewrite itself for no payoff here.
         try:
             result = self._run_git_command(
-                ["git", "branch", "--show-current"],
+                ["git", "for-each-ref", "--format=%(refname)", "refs/original/"],
                 check=True, capture_output=True, text=True
             )
-            current_branch = result.stdout.strip()
+            for ref in result.stdout.split():
+                self._run_git_command(["git", "update-ref", "-d", ref], check=True, capture_output=True)
+
+            self._run_git_command(["git", "gc", "--prune=now"], check=True, capture_output=True)
+            print("Cleaned up filter-branch refs")
+        except subprocess.CalledProcessError:
+            print("Warning: Could not clean up filter-branch refs")
+
+    def _create_backup(self):
+        try:
+            current_branch = self.get_current_branch()
             backup_name = f"backup-{current_branch}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
             
             self._run_git_command(["git", "branch", backup_name], check=True, capture_output=True)
@@ -201,6 +774,10 @@ Example:
     parser.add_argument("--author-name", help="New author name")
     parser.add_argument("--author-email", help="New author email")
     parser.add_argument("--no-backup", action="store_true", help="Skip backup creation")
+    parser.add_argument("--yes", "-y", action="store_true",
+                        help="Skip the confirmation prompt (implied when stdin is not a terminal)")
+    parser.add_argument("--cleanup", action="store_true",
+                        help="Remove refs/original backups and run git gc after rewriting")
 
     args = parser.parse_args()
 
@@ -225,10 +802,17 @@ Example:
             print(f"WARNING: This will modify the last {args.commits} commits!")
         
         print("This will modify Git history!")
-        response = input("Continue? (y/n): ")
-        if response.lower() in ['y', 'yes']:
+        # Scripted runs (xargs, CI) have no terminal to answer the prompt
+        # on; --yes or a non-tty stdin proceeds without blocking
+        if args.yes or not sys.stdin.isatty():
+            confirmed = True
+        else:
+            confirmed = input("Continue? (y/n): ").lower() in ['y', 'yes']
+        if confirmed:
             success = rewriter.rewrite_commits(commit_count, not args.no_backup)
             if success:
+                if args.cleanup:
+                    rewriter.clean_filter_branch_refs()
                 print("Warning: Use 'git push --force-with-lease' if commits were already pushed")
         else:
             print("Cancelled")
@@ -1,31 +1,60 @@
 #!/usr/bin/env python3
 
 import unittest
-from unittest.mock import patch, MagicMock, call
-import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
 import os
-import shutil
-from datetime import datetime, timedelta
+from datetime import datetime
 import subprocess
-import sys
 
-sys.path.insert(0, os.path.dirname(__file__))
-from git_rewriter import GitCommitRewriter
+import pytest
+
+from git_commit_rewritter import GitCommitRewriter, main
+
+# What build_env_filter_script emits for the two-commit map in
+# test_build_env_filter_script_basic; dict insertion order is the
+# script's branch order
+_EXPECTED_BASIC_SCRIPT = """\
+# Commit date mapping
+case "$GIT_COMMIT" in
+abc123)
+    export GIT_AUTHOR_DATE='2024-01-15 10:30:00'
+    export GIT_COMMITTER_DATE='2024-01-15 10:30:00'
+    ;;
+def456)
+    export GIT_AUTHOR_DATE='2024-01-16 14:45:00'
+    export GIT_COMMITTER_DATE='2024-01-16 14:45:00'
+    ;;
+esac"""
+
+# Reused by every test that only needs "some git failure"; side_effect
+# raises the instance without mutating it, so sharing one is safe
+_GIT_ERROR = subprocess.CalledProcessError(1, ["git"])
+
+# Fixture dates reused by the script/callback-builder tests
+_DT_JAN15 = datetime(2024, 1, 15, 10, 30, 0)
+_DT_JAN16 = datetime(2024, 1, 16, 14, 45, 0)
+
+# Stubs reused across side_effect lists; only .stdout is ever read, so a
+# single instance serves every test that needs "the probe succeeded" or
+# "a minimal raw commit object"
+_PROBE_OK = SimpleNamespace(stdout=".git\nmain\n")
+_RAW_COMMIT = (b"tree 4b825dc642cb6eb9a060e54bf8d69288fbee4904\n"
+               b"author A <a@a> 1500000000 +0000\n"
+               b"committer A <a@a> 1500000000 +0000\n"
+               b"\nmsg\n")
 
 
 class TestGitCommitRewriter(unittest.TestCase):
-    
-    def setUp(self):
-        """Set up test fixtures before each test method."""
-        self.temp_dir = tempfile.mkdtemp()
-        self.start_date = "2024-01-01"
-        self.end_date = "2024-01-31"
-        
-    def tearDown(self):
-        """Clean up after each test method."""
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-    
+
+    @pytest.fixture(autouse=True, scope="class")
+    @classmethod
+    def _fixtures(cls, request, tmp_path_factory):
+        """One shared directory: the init tests only stat it, never write."""
+        request.cls.temp_dir = str(tmp_path_factory.mktemp("repo"))
+        request.cls.start_date = "2024-01-01"
+        request.cls.end_date = "2024-01-31"
+
     def test_init_valid_parameters(self):
         """Test GitCommitRewriter initialization with valid parameters."""
         rewriter = GitCommitRewriter(
@@ -53,6 +82,16 @@ class TestGitCommitRewriter(unittest.TestCase):
             )
         self.assertIn("Start date must be before end date", str(context.exception))
     
+    def test_init_weekend_only_range(self):
+        """Test initialization with a date range containing no weekdays."""
+        with self.assertRaises(ValueError) as context:
+            GitCommitRewriter(
+                start_date="2024-01-06",
+                end_date="2024-01-07",
+                repo_path=self.temp_dir
+            )
+        self.assertIn("Date range contains no weekdays", str(context.exception))
+
     def test_init_invalid_repo_path(self):
         """Test initialization with non-existent repository path."""
         with self.assertRaises(ValueError) as context:
@@ -85,123 +124,201 @@ class TestGitCommitRewriter(unittest.TestCase):
         self.assertEqual(rewriter.author_email, "test@example.com")
 
 
-class TestGitCommitRewriterMethods(unittest.TestCase):
-    
-    def setUp(self):
-        """Set up test fixtures."""
-        self.temp_dir = tempfile.mkdtemp()
+class _RewriterTestBase(unittest.TestCase):
+    """Shared per-test fixture for every class that drives a rewriter."""
+
+    @pytest.fixture(autouse=True)
+    def _fixtures(self, tmp_path):
+        """Build a rewriter rooted in pytest's managed tmp_path."""
+        self.temp_dir = str(tmp_path)
         self.rewriter = GitCommitRewriter(
             start_date="2024-01-01",
             end_date="2024-01-31",
             repo_path=self.temp_dir
         )
-    
-    def tearDown(self):
-        """Clean up after tests."""
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-    
+        # Exercise the subprocess paths regardless of whether pygit2 is
+        # installed, since the mocks below intercept subprocess calls
+        self.rewriter._pygit_repo = None
+
+    @pytest.fixture(autouse=True)
+    def _capsys(self, capsys):
+        """Expose captured stdout to the unittest-style methods."""
+        self.capsys = capsys
+
+
+class TestGitCommitRewriterMethods(_RewriterTestBase):
+
+    @pytest.fixture(autouse=True, scope="class")
+    @classmethod
+    def _shared_rewriter(cls, request, tmp_path_factory):
+        """One rewriter for the pure-method tests, built once per class."""
+        request.cls.shared_rewriter = GitCommitRewriter(
+            start_date="2024-01-01",
+            end_date="2024-01-31",
+            repo_path=str(tmp_path_factory.mktemp("repo"))
+        )
+
     @patch('subprocess.run')
     def test_check_git_repo_valid(self, mock_run):
         """Test check_git_repo with valid repository."""
-        mock_run.return_value = MagicMock()
-        
+        mock_run.return_value = _PROBE_OK
+
         result = self.rewriter.check_git_repo()
-        
+
         self.assertTrue(result)
         mock_run.assert_called_once_with(
-            ["git", "rev-parse", "--git-dir"],
-            cwd=self.temp_dir,
+            ["git", "-C", self.temp_dir, "rev-parse", "--git-dir", "--abbrev-ref", "HEAD"],
+            env=self.rewriter._env,
             check=True,
-            capture_output=True
+            capture_output=True,
+            text=True
         )
     
+    @patch('subprocess.run')
+    def test_check_git_repo_cached(self, mock_run):
+        """Test that repeated check_git_repo calls reuse the first result."""
+        mock_run.return_value = _PROBE_OK
+
+        self.assertTrue(self.rewriter.check_git_repo())
+        self.assertTrue(self.rewriter.check_git_repo())
+
+        # The fused probe also answers the branch lookup without a new spawn
+        self.assertEqual(self.rewriter.get_current_branch(), "main")
+        mock_run.assert_called_once()
+
     @patch('subprocess.run')
     def test_check_git_repo_invalid(self, mock_run):
         """Test check_git_repo with invalid repository."""
-        mock_run.side_effect = subprocess.CalledProcessError(1, ["git"])
+        mock_run.side_effect = _GIT_ERROR
         
         result = self.rewriter.check_git_repo()
         
         self.assertFalse(result)
     
-    @patch('subprocess.run')
-    def test_get_recent_commits_success(self, mock_run):
+    @patch('subprocess.Popen')
+    def test_get_recent_commits_success(self, mock_popen):
         """Test get_recent_commits with successful git log."""
-        mock_run.return_value = MagicMock(
-            stdout="abc123\ndef456\nghi789\n"
-        )
-        
-        commits = self.rewriter.get_recent_commits(3)
-        
+        process = MagicMock()
+        process.stdout = iter(["abc123\n", "def456\n", "ghi789\n"])
+        mock_popen.return_value = process
+
+        commits = list(self.rewriter.get_recent_commits(3))
+
         self.assertEqual(commits, ["abc123", "def456", "ghi789"])
-        mock_run.assert_called_once_with(
-            ["git", "log", "--max-count=3", "--format=%H"],
-            cwd=self.temp_dir,
-            check=True,
-            capture_output=True,
+        mock_popen.assert_called_once_with(
+            ["git", "-C", self.temp_dir, "log", "--max-count=3", "--topo-order", "--format=%H"],
+            env=self.rewriter._env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True
         )
-    
-    @patch('subprocess.run')
-    def test_get_recent_commits_empty(self, mock_run):
+
+    @patch('subprocess.Popen')
+    def test_get_recent_commits_empty(self, mock_popen):
         """Test get_recent_commits with no commits."""
-        mock_run.return_value = MagicMock(stdout="")
-        
-        commits = self.rewriter.get_recent_commits(5)
-        
+        process = MagicMock()
+        process.stdout = iter([])
+        mock_popen.return_value = process
+
+        commits = list(self.rewriter.get_recent_commits(5))
+
         self.assertEqual(commits, [])
-    
-    @patch('subprocess.run')
-    def test_get_recent_commits_error(self, mock_run):
-        """Test get_recent_commits with git error."""
-        mock_run.side_effect = subprocess.CalledProcessError(1, ["git"])
-        
-        commits = self.rewriter.get_recent_commits(3)
-        
+
+    @patch('subprocess.Popen')
+    def test_get_recent_commits_error(self, mock_popen):
+        """Test get_recent_commits when git cannot be spawned."""
+        mock_popen.side_effect = OSError("git not found")
+
+        commits = list(self.rewriter.get_recent_commits(3))
+
         self.assertEqual(commits, [])
     
+    @patch('subprocess.Popen')
+    def test_get_recent_commits_with_dates(self, mock_popen):
+        """Test the fused commit-and-date listing."""
+        process = MagicMock()
+        process.stdout = iter(["abc123 2024-01-15T10:30:00+00:00\n"])
+        mock_popen.return_value = process
+
+        pairs = list(self.rewriter.get_recent_commits_with_dates(1))
+
+        self.assertEqual(pairs, [("abc123", datetime.fromisoformat("2024-01-15T10:30:00+00:00"))])
+        self.assertEqual(
+            mock_popen.call_args[0][0],
+            ["git", "-C", self.temp_dir, "log", "--max-count=1", "--topo-order", "--format=%H %aI"]
+        )
+
+    @patch('subprocess.Popen')
+    def test_get_commit_original_dates(self, mock_popen):
+        """Test batched original-date retrieval."""
+        process = MagicMock()
+        process.communicate.return_value = ("abc123 2024-01-15T10:30:00+00:00\n", "")
+        mock_popen.return_value = process
+
+        dates = self.rewriter.get_commit_original_dates(["abc123"])
+
+        self.assertEqual(dates, {"abc123": datetime.fromisoformat("2024-01-15T10:30:00+00:00")})
+        self.assertEqual(
+            mock_popen.call_args[0][0][:5],
+            ["git", "-C", self.temp_dir, "log", "--no-walk=unsorted"]
+        )
+
+    def test_get_commit_original_dates_empty(self):
+        """Test that an empty commit list skips the subprocess entirely."""
+        self.assertEqual(self.shared_rewriter.get_commit_original_dates([]), {})
+
     def test_generate_random_work_datetime_range(self):
-        """Test that generated datetime is within specified range."""
-        for _ in range(10):  # Test multiple generations
-            dt = self.rewriter.generate_random_work_datetime()
-            
+        """Test that generated datetimes are within the specified range."""
+        # The bounds don't depend on the draw, so compute them once
+        start_date = self.shared_rewriter.start_date.date()
+        end_date = self.shared_rewriter.end_date.date()
+        work_start_minutes = self.shared_rewriter.work_start.hour * 60 + self.shared_rewriter.work_start.minute
+        work_end_minutes = self.shared_rewriter.work_end.hour * 60 + self.shared_rewriter.work_end.minute
+        jitter_minutes = self.shared_rewriter.jitter_minutes
+
+        for dt in self.shared_rewriter.generate_random_work_datetimes(10):
             # Check date range
-            self.assertGreaterEqual(dt.date(), self.rewriter.start_date.date())
-            self.assertLessEqual(dt.date(), self.rewriter.end_date.date())
-            
+            self.assertGreaterEqual(dt.date(), start_date)
+            self.assertLessEqual(dt.date(), end_date)
+
             # Check it's a weekday (0-4, Monday-Friday)
             self.assertLess(dt.weekday(), 5)
-            
-            # Check work hours (with potential jitter)
-            work_start_minutes = self.rewriter.work_start.hour * 60 + self.rewriter.work_start.minute
-            work_end_minutes = self.rewriter.work_end.hour * 60 + self.rewriter.work_end.minute
-            dt_minutes = dt.hour * 60 + dt.minute
-            
+
             # Should be within work hours +/- jitter
-            self.assertGreaterEqual(dt_minutes, work_start_minutes - self.rewriter.jitter_minutes)
-            self.assertLessEqual(dt_minutes, work_end_minutes + self.rewriter.jitter_minutes)
+            dt_minutes = dt.hour * 60 + dt.minute
+            self.assertGreaterEqual(dt_minutes, work_start_minutes - jitter_minutes)
+            self.assertLessEqual(dt_minutes, work_end_minutes + jitter_minutes)
     
+    def test_generate_random_work_datetimes_batch(self):
+        """Test that batch generation honors count and date constraints."""
+        datetimes = self.shared_rewriter.generate_random_work_datetimes(25)
+
+        self.assertEqual(len(datetimes), 25)
+        for dt in datetimes:
+            self.assertGreaterEqual(dt.date(), self.shared_rewriter.start_date.date())
+            self.assertLessEqual(dt.date(), self.shared_rewriter.end_date.date())
+            self.assertLess(dt.weekday(), 5)
+
     def test_build_env_filter_script_basic(self):
         """Test building env-filter script with basic parameters."""
         commit_date_map = {
-            "abc123": datetime(2024, 1, 15, 10, 30, 0),
-            "def456": datetime(2024, 1, 16, 14, 45, 0)
+            "abc123": _DT_JAN15,
+            "def456": _DT_JAN16
         }
         
-        script = self.rewriter.build_env_filter_script(commit_date_map)
-        
-        expected_lines = [
-            'if [ "$GIT_COMMIT" = "abc123" ]; then',
-            '    export GIT_AUTHOR_DATE="2024-01-15 10:30:00"',
-            '    export GIT_COMMITTER_DATE="2024-01-15 10:30:00"',
-            'elif [ "$GIT_COMMIT" = "def456" ]; then',
-            '    export GIT_AUTHOR_DATE="2024-01-16 14:45:00"',
-            '    export GIT_COMMITTER_DATE="2024-01-16 14:45:00"',
-            'fi'
-        ]
-        
-        self.assertEqual(script, '\n'.join(expected_lines))
+        script = self.shared_rewriter.build_env_filter_script(commit_date_map)
+
+        self.assertEqual(script, _EXPECTED_BASIC_SCRIPT)
+
+    def test_build_env_filter_script_with_progress_fifo(self):
+        """Test that the script reports progress through the named pipe."""
+        commit_date_map = {
+            "abc123": _DT_JAN15
+        }
+
+        script = self.shared_rewriter.build_env_filter_script(commit_date_map, "/tmp/progress_fifo")
+
+        self.assertIn('    echo "$GIT_COMMIT" >> "/tmp/progress_fifo"\n    ;;', script)
     
     def test_build_env_filter_script_with_author(self):
         """Test building env-filter script with author information."""
@@ -214,7 +331,7 @@ class TestGitCommitRewriterMethods(unittest.TestCase):
         )
         
         commit_date_map = {
-            "abc123": datetime(2024, 1, 15, 10, 30, 0)
+            "abc123": _DT_JAN15
         }
         
         script = rewriter.build_env_filter_script(commit_date_map)
@@ -223,157 +340,421 @@ class TestGitCommitRewriterMethods(unittest.TestCase):
         self.assertIn('export GIT_COMMITTER_NAME="Test Author"', script)
         self.assertIn('export GIT_AUTHOR_EMAIL="test@example.com"', script)
         self.assertIn('export GIT_COMMITTER_EMAIL="test@example.com"', script)
+
+        # The exports are defined once and invoked from each matched branch
+        self.assertEqual(script.count('export GIT_AUTHOR_NAME'), 1)
+        self.assertIn('set_author() {', script)
+        self.assertIn('    set_author\n    ;;', script)
+
+    def test_build_env_filter_script_with_date_map_file(self):
+        """Test the keyed-file lookup form used for huge commit maps."""
+        commit_date_map = {
+            "abc123": _DT_JAN15
+        }
+
+        script = self.shared_rewriter.build_env_filter_script(
+            commit_date_map, date_map_path="/tmp/date_map")
+
+        self.assertIn('grep -m 1 "^$GIT_COMMIT " "/tmp/date_map"', script)
+        self.assertIn('export GIT_AUTHOR_DATE="$NEW_DATE"', script)
+        self.assertIn('export GIT_COMMITTER_DATE="$NEW_DATE"', script)
+        self.assertNotIn('case "$GIT_COMMIT" in', script)
+
+    def test_patch_ident_line(self):
+        """Test rewriting fast-export author/committer lines."""
+        line = b"author John Doe <john@example.com> 1500000000 +0200\n"
+
+        patched = GitCommitRewriter._patch_ident_line(line, b"1705314600 +0000", None, None)
+        self.assertEqual(patched, b"author John Doe <john@example.com> 1705314600 +0000\n")
+
+        patched = GitCommitRewriter._patch_ident_line(line, b"1705314600 +0000", b"Jane", b"jane@example.com")
+        self.assertEqual(patched, b"author Jane <jane@example.com> 1705314600 +0000\n")
+
+    def test_build_commit_callback_source_basic(self):
+        """Test building filter-repo commit callback with basic parameters."""
+        commit_date_map = {
+            "abc123": _DT_JAN15
+        }
+
+        source = self.shared_rewriter.build_commit_callback_source(commit_date_map)
+
+        local_date = _DT_JAN15.astimezone()
+        raw_date = f"{int(local_date.timestamp())} {local_date.strftime('%z')}"
+        self.assertIn(f'b"abc123": b"{raw_date}"', source)
+        self.assertIn('commit.author_date = new_date', source)
+        self.assertIn('commit.committer_date = new_date', source)
+
+    def test_build_commit_callback_source_with_author(self):
+        """Test building filter-repo commit callback with author information."""
+        rewriter = GitCommitRewriter(
+            start_date="2024-01-01",
+            end_date="2024-01-31",
+            repo_path=self.temp_dir,
+            author_name="Test Author",
+            author_email="test@example.com"
+        )
+
+        commit_date_map = {
+            "abc123": _DT_JAN15
+        }
+
+        source = rewriter.build_commit_callback_source(commit_date_map)
+
+        self.assertIn('commit.author_name = b"Test Author"', source)
+        self.assertIn('commit.committer_name = b"Test Author"', source)
+        self.assertIn('commit.author_email = b"test@example.com"', source)
+        self.assertIn('commit.committer_email = b"test@example.com"', source)
     
+    @patch('subprocess.run')
+    def test_clean_filter_branch_refs(self, mock_run):
+        """Test that cleanup deletes refs/original and runs a plain gc."""
+        mock_run.side_effect = [
+            SimpleNamespace(stdout="refs/original/refs/heads/main\n"),  # for-each-ref
+            SimpleNamespace(),  # update-ref -d
+            SimpleNamespace()   # git gc
+        ]
+
+        self.rewriter.clean_filter_branch_refs()
+
+        self.assertEqual(
+            mock_run.call_args_list[1][0][0],
+            ["git", "-C", self.temp_dir, "update-ref", "-d", "refs/original/refs/heads/main"]
+        )
+        self.assertEqual(
+            mock_run.call_args_list[2][0][0],
+            ["git", "-C", self.temp_dir, "gc", "--prune=now"]
+        )
+        self.assertIn("Cleaned up filter-branch refs", self.capsys.readouterr().out)
+
     @patch('subprocess.run')
     def test_create_backup_success(self, mock_run):
         """Test successful backup creation."""
         mock_run.side_effect = [
-            MagicMock(stdout="main\n"),  # git branch --show-current
-            MagicMock()  # git branch backup-...
+            _PROBE_OK,  # repo probe
+            SimpleNamespace()  # git branch backup-...
         ]
         
-        with patch('builtins.print') as mock_print:
-            self.rewriter._create_backup()
-        
+        self.rewriter._create_backup()
+
         self.assertEqual(mock_run.call_count, 2)
-        mock_print.assert_called()
-        print_call_args = mock_print.call_args[0][0]
-        self.assertIn("Created backup branch:", print_call_args)
+        self.assertIn("Created backup branch:", self.capsys.readouterr().out)
     
     @patch('subprocess.run')
     def test_create_backup_failure(self, mock_run):
         """Test backup creation failure."""
-        mock_run.side_effect = subprocess.CalledProcessError(1, ["git"])
-        
-        with patch('builtins.print') as mock_print:
-            self.rewriter._create_backup()
+        mock_run.side_effect = _GIT_ERROR
         
-        mock_print.assert_called_with("Warning: Could not create backup branch")
+        self.rewriter._create_backup()
 
+        self.assertIn("Warning: Could not create backup branch", self.capsys.readouterr().out)
 
-class TestGitCommitRewriterIntegration(unittest.TestCase):
-    
-    def setUp(self):
-        """Set up integration test fixtures."""
-        self.temp_dir = tempfile.mkdtemp()
-        self.rewriter = GitCommitRewriter(
-            start_date="2024-01-01",
-            end_date="2024-01-31",
-            repo_path=self.temp_dir
-        )
-    
-    def tearDown(self):
-        """Clean up after integration tests."""
-        if os.path.exists(self.temp_dir):
-            shutil.rmtree(self.temp_dir)
-    
-    @patch('subprocess.run')
-    def test_rewrite_commits_not_git_repo(self, mock_run):
+
+class TestGitCommitRewriterIntegration(_RewriterTestBase):
+
+    @pytest.fixture(autouse=True)
+    def _mock_git(self, monkeypatch):
+        """Mock the git subprocess boundary.
+
+        One boundary patch per test instead of a decorator stack on every
+        method; tests configure side_effect/return_value directly.
+        """
+        self.mock_run = MagicMock()
+        self.mock_popen = MagicMock()
+        self.mock_which = MagicMock(return_value=None)
+        monkeypatch.setattr("git_commit_rewritter.subprocess.run", self.mock_run)
+        monkeypatch.setattr("git_commit_rewritter.subprocess.Popen", self.mock_popen)
+        monkeypatch.setattr("git_commit_rewritter.shutil.which", self.mock_which)
+
+    def test_rewrite_commits_not_git_repo(self):
         """Test rewrite_commits when not in a git repository."""
-        mock_run.side_effect = subprocess.CalledProcessError(1, ["git"])
-        
-        with patch('builtins.print') as mock_print:
-            result = self.rewriter.rewrite_commits(5)
+        self.mock_run.side_effect = _GIT_ERROR
         
+        result = self.rewriter.rewrite_commits(5)
+
         self.assertFalse(result)
-        mock_print.assert_called_with(f"Error: Not a Git repository: {self.temp_dir}")
+        self.assertIn(f"Error: Not a Git repository: {self.temp_dir}", self.capsys.readouterr().out)
     
-    @patch('subprocess.run')
-    def test_rewrite_commits_no_commits(self, mock_run):
+    def test_rewrite_commits_no_commits(self):
         """Test rewrite_commits when no commits are found."""
-        mock_run.side_effect = [
-            MagicMock(),  # check_git_repo
-            MagicMock(stdout="")  # get_recent_commits
+        self.mock_run.side_effect = [
+            SimpleNamespace(stdout=".git\nmain\n")  # repo probe
         ]
+        self.mock_popen.return_value = MagicMock(stdout=iter([]))  # get_recent_commits
         
-        with patch('builtins.print') as mock_print:
-            result = self.rewriter.rewrite_commits(5)
-        
+        result = self.rewriter.rewrite_commits(5)
+
         self.assertFalse(result)
-        mock_print.assert_called_with("No commits found to rewrite")
+        self.assertIn("No commits found to rewrite", self.capsys.readouterr().out)
     
-    @patch('subprocess.run')
-    def test_rewrite_commits_success(self, mock_run):
+    def test_rewrite_commits_success(self):
         """Test successful commit rewriting."""
-        mock_run.side_effect = [
-            MagicMock(),  # check_git_repo
-            MagicMock(stdout="abc123\ndef456\n"),  # get_recent_commits
-            MagicMock(stdout="main\n"),  # backup: git branch --show-current
-            MagicMock(),  # backup: git branch backup-...
-            MagicMock()   # git filter-branch
+        self.mock_run.side_effect = [
+            _PROBE_OK,  # repo probe
+            SimpleNamespace(),  # backup: git branch backup-...
+            SimpleNamespace(stdout=b"1" * 40 + b"\n"),  # hash-object (oldest)
+            SimpleNamespace(stdout=b"2" * 40 + b"\n"),  # hash-object (newest)
+            SimpleNamespace()   # update-ref
         ]
-        
-        with patch('builtins.print') as mock_print:
-            result = self.rewriter.rewrite_commits(2, create_backup=True)
-        
+
+        log_process = MagicMock(stdout=iter([
+            "abc123 2026-01-10T10:00:00+00:00\n",
+            "def456 2026-01-11T11:00:00+00:00\n",
+        ]))
+        reader_process = MagicMock()
+        reader_process.poll.return_value = None  # still running between reads
+        reader_process.stdout.readline.side_effect = [
+            b"def456 commit %d\n" % len(_RAW_COMMIT),
+            b"abc123 commit %d\n" % len(_RAW_COMMIT),
+        ]
+        reader_process.stdout.read.side_effect = [_RAW_COMMIT, b"\n", _RAW_COMMIT, b"\n"]
+        self.mock_popen.side_effect = [log_process, reader_process]
+
+        result = self.rewriter.rewrite_commits(2, create_backup=True)
+
         self.assertTrue(result)
-        mock_print.assert_any_call("Successfully rewrote 2 commits!")
-        
-        # Verify filter-branch was called
-        filter_branch_call = None
-        for call in mock_run.call_args_list:
-            if call[0][0][1] == "filter-branch":
-                filter_branch_call = call
-                break
-        
-        self.assertIsNotNone(filter_branch_call)
-        self.assertEqual(filter_branch_call[0][0][:3], ["git", "filter-branch", "-f"])
+        self.assertIn("Successfully rewrote 2 commits!", self.capsys.readouterr().out)
+
+        # Verify the plumbing path rewrote both objects and moved the branch
+        self.assertEqual(
+            self.mock_popen.call_args_list[1][0][0],
+            ["git", "-C", self.temp_dir, "cat-file", "--batch"]
+        )
+        self.assertEqual(
+            self.mock_run.call_args_list[2][0][0][:5],
+            ["git", "-C", self.temp_dir, "hash-object", "-t"]
+        )
+        update_ref_call = self.mock_run.call_args_list[-1]
+        self.assertEqual(
+            update_ref_call[0][0],
+            ["git", "-C", self.temp_dir, "update-ref", "refs/heads/main", "2" * 40]
+        )
     
-    @patch('subprocess.run')
-    def test_rewrite_commits_filter_branch_error(self, mock_run):
+    def test_rewrite_commits_success_no_backup(self):
+        """Test the success path with backup creation disabled."""
+        self.mock_run.side_effect = [
+            _PROBE_OK,  # repo probe
+            SimpleNamespace(stdout=b"1" * 40 + b"\n"),  # hash-object
+            SimpleNamespace()   # update-ref
+        ]
+
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        reader_process = MagicMock()
+        reader_process.poll.return_value = None
+        reader_process.stdout.readline.side_effect = [b"abc123 commit %d\n" % len(_RAW_COMMIT)]
+        reader_process.stdout.read.side_effect = [_RAW_COMMIT, b"\n"]
+        self.mock_popen.side_effect = [log_process, reader_process]
+
+        result = self.rewriter.rewrite_commits(1, create_backup=False)
+
+        self.assertTrue(result)
+        # No backup branch call anywhere in the run
+        for run_call in self.mock_run.call_args_list:
+            self.assertNotIn("branch", run_call[0][0])
+
+    def test_rewrite_commits_detached_head(self):
+        """Test that a detached HEAD updates HEAD itself, not a branch."""
+        self.mock_run.side_effect = [
+            SimpleNamespace(stdout=".git\nHEAD\n"),  # repo probe (detached)
+            SimpleNamespace(stdout=b"1" * 40 + b"\n"),  # hash-object
+            SimpleNamespace()   # update-ref
+        ]
+
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        reader_process = MagicMock()
+        reader_process.poll.return_value = None
+        reader_process.stdout.readline.side_effect = [b"abc123 commit %d\n" % len(_RAW_COMMIT)]
+        reader_process.stdout.read.side_effect = [_RAW_COMMIT, b"\n"]
+        self.mock_popen.side_effect = [log_process, reader_process]
+
+        result = self.rewriter.rewrite_commits(1, create_backup=False)
+
+        self.assertTrue(result)
+        update_ref_call = self.mock_run.call_args_list[-1]
+        self.assertEqual(
+            update_ref_call[0][0],
+            ["git", "-C", self.temp_dir, "update-ref", "HEAD", "1" * 40]
+        )
+
+    def test_rewrite_commits_uses_filter_repo(self):
+        """Test that rewrite_commits prefers filter-repo when available."""
+        self.mock_which.return_value = '/usr/bin/git-filter-repo'
+        self.mock_run.side_effect = [
+            _PROBE_OK,  # repo probe
+            SimpleNamespace()   # git filter-repo
+        ]
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        self.mock_popen.return_value = log_process
+
+        result = self.rewriter.rewrite_commits(1, create_backup=False)
+
+        self.assertTrue(result)
+        filter_repo_call = self.mock_run.call_args_list[-1]
+        self.assertEqual(
+            filter_repo_call[0][0][:5],
+            ["git", "-C", self.temp_dir, "filter-repo", "--force"]
+        )
+
+    def test_rewrite_commits_fast_export_fallback(self):
+        """Test the fast-export pipeline when the plumbing rewrite fails."""
+        self.mock_run.side_effect = [
+            SimpleNamespace(stdout=".git\nmain\n")  # repo probe
+        ]
+
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        export_process = MagicMock()
+        export_process.stdout.readline.return_value = b""
+        export_process.wait.return_value = 0
+        import_process = MagicMock()
+        import_process.wait.return_value = 0
+        self.mock_popen.side_effect = [log_process, export_process, import_process]
+
+        with patch.object(self.rewriter, '_rewrite_with_commit_tree',
+                          side_effect=subprocess.CalledProcessError(1, ["git", "cat-file"])):
+            result = self.rewriter.rewrite_commits(1, create_backup=False)
+
+        self.assertTrue(result)
+        self.assertEqual(self.mock_popen.call_args_list[1][0][0][3], "fast-export")
+        self.assertEqual(self.mock_popen.call_args_list[2][0][0][3], "fast-import")
+
+    def test_rewrite_commits_fast_export_broken_pipe(self):
+        """Test the fallback when fast-import dies mid-stream."""
+        self.mock_run.side_effect = [
+            _PROBE_OK,  # repo probe
+            SimpleNamespace(),  # rev-parse range anchor
+            SimpleNamespace()   # git filter-branch
+        ]
+
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        export_process = MagicMock()
+        export_process.stdout.readline.side_effect = [b"commit refs/heads/main\n", b""]
+        import_process = MagicMock()
+        import_process.stdin.write.side_effect = BrokenPipeError()
+        import_process.wait.return_value = 128
+        self.mock_popen.side_effect = [log_process, export_process, import_process]
+
+        with patch.object(self.rewriter, '_rewrite_with_commit_tree',
+                          side_effect=subprocess.CalledProcessError(1, ["git", "cat-file"])):
+            result = self.rewriter.rewrite_commits(1, create_backup=False)
+
+        self.assertTrue(result)
+        filter_branch_call = self.mock_run.call_args_list[-1]
+        self.assertEqual(
+            filter_branch_call[0][0][:5],
+            ["git", "-C", self.temp_dir, "filter-branch", "-f"]
+        )
+
+    def test_rewrite_commits_falls_back_to_filter_branch(self):
+        """Test the filter-branch fallback when fast-export fails."""
+        self.mock_run.side_effect = [
+            _PROBE_OK,  # repo probe
+            SimpleNamespace(),  # rev-parse range anchor
+            SimpleNamespace()   # git filter-branch
+        ]
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        self.mock_popen.return_value = log_process
+
+        with patch.object(self.rewriter, '_rewrite_with_commit_tree',
+                          side_effect=subprocess.CalledProcessError(1, ["git", "cat-file"])), \
+             patch.object(self.rewriter, 'rewrite_via_fast_export',
+                          side_effect=subprocess.CalledProcessError(1, ["git", "fast-import"])):
+            result = self.rewriter.rewrite_commits(1, create_backup=False)
+
+        self.assertTrue(result)
+        filter_branch_call = self.mock_run.call_args_list[-1]
+        self.assertEqual(
+            filter_branch_call[0][0][:5],
+            ["git", "-C", self.temp_dir, "filter-branch", "-f"]
+        )
+        # The walk is bounded to the rewritten range
+        self.assertEqual(filter_branch_call[0][0][-2:], ["--", "abc123^..HEAD"])
+
+    def test_filter_branch_quotes_sourced_script_path(self):
+        """Test that the sourced env-filter path survives spaces."""
+        spaced_repo = os.path.join(self.temp_dir, "repo with space")
+        os.makedirs(os.path.join(spaced_repo, ".git"))
+        rewriter = GitCommitRewriter(
+            start_date="2024-01-01",
+            end_date="2024-01-31",
+            repo_path=spaced_repo
+        )
+        rewriter._pygit_repo = None
+
+        self.mock_run.side_effect = [
+            SimpleNamespace(),  # rev-parse range anchor
+            SimpleNamespace()   # git filter-branch
+        ]
+
+        # Force the /dev/shm-less fallback so the scratch files land in the
+        # spaced repo's .git directory
+        real_isdir = os.path.isdir
+        with patch('git_commit_rewritter.os.path.isdir',
+                   side_effect=lambda path: False if path == "/dev/shm" else real_isdir(path)):
+            rewriter._rewrite_with_filter_branch({"abc123": _DT_JAN15}, 1)
+
+        filter_branch_args = self.mock_run.call_args_list[-1][0][0]
+        env_filter = filter_branch_args[filter_branch_args.index("--env-filter") + 1]
+        script_path = os.path.join(spaced_repo, ".git", f"rewrite_env_filter_{os.getpid()}")
+        self.assertEqual(env_filter, f'. "{script_path}"')
+
+    def test_rewrite_commits_filter_branch_error(self):
         """Test rewrite_commits when filter-branch fails."""
-        mock_run.side_effect = [
-            MagicMock(),  # check_git_repo
-            MagicMock(stdout="abc123\n"),  # get_recent_commits
+        self.mock_run.side_effect = [
+            _PROBE_OK,  # repo probe
+            SimpleNamespace(),  # rev-parse range anchor
             subprocess.CalledProcessError(1, ["git", "filter-branch"])  # filter-branch fails
         ]
-        
-        with patch('builtins.print') as mock_print:
+        log_process = MagicMock(stdout=iter(["abc123 2026-01-10T10:00:00+00:00\n"]))
+        self.mock_popen.return_value = log_process
+
+        with patch.object(self.rewriter, '_rewrite_with_commit_tree',
+                          side_effect=subprocess.CalledProcessError(1, ["git", "cat-file"])), \
+             patch.object(self.rewriter, 'rewrite_via_fast_export',
+                          side_effect=subprocess.CalledProcessError(1, ["git", "fast-import"])):
             result = self.rewriter.rewrite_commits(1, create_backup=False)
-        
+
         self.assertFalse(result)
-        mock_print.assert_any_call("Error during rewrite: Command '['git', 'filter-branch']' returned non-zero exit status 1.")
+        self.assertIn("Error during rewrite: Command '['git', 'filter-branch']' returned non-zero exit status 1.",
+                      self.capsys.readouterr().out)
 
 
 class TestMainFunction(unittest.TestCase):
+
+    @pytest.fixture(autouse=True)
+    def _capsys(self, capsys):
+        """Expose captured stdout to the unittest-style methods."""
+        self.capsys = capsys
+
     
     @patch('sys.argv', ['git_rewriter.py', '--all', '--start-date', '2024-01-01', '--end-date', '2024-01-31'])
     @patch('builtins.input', return_value='n')
     def test_main_user_cancellation(self, mock_input):
         """Test main function when user cancels operation."""
-        with patch('builtins.print') as mock_print:
-            from git_rewriter import main
+        with patch('sys.stdin') as mock_stdin:
+            mock_stdin.isatty.return_value = True
             main()
-        
-        mock_print.assert_any_call("This will modify Git history!")
-        mock_print.assert_any_call("Cancelled")
+
+        output = self.capsys.readouterr().out
+        self.assertIn("This will modify Git history!", output)
+        self.assertIn("Cancelled", output)
+
+    @patch('sys.argv', ['git_rewriter.py', '--all', '--yes', '--start-date', '2024-01-01', '--end-date', '2024-01-31'])
+    def test_main_yes_flag_skips_prompt(self):
+        """Test that --yes bypasses the confirmation prompt."""
+        with patch('builtins.input') as mock_input, \
+             patch('git_commit_rewritter.GitCommitRewriter.rewrite_commits',
+                   return_value=False) as mock_rewrite:
+            main()
+
+        mock_input.assert_not_called()
+        mock_rewrite.assert_called_once()
     
     @patch('sys.argv', ['git_rewriter.py', '--all', '--start-date', '2024-01-31', '--end-date', '2024-01-01'])
     def test_main_invalid_date_range(self):
         """Test main function with invalid date range."""
-        with patch('builtins.print') as mock_print, \
-             patch('sys.exit') as mock_exit:
-            from git_rewriter import main
+        with pytest.raises(SystemExit) as exc_info:
             main()
-        
-        mock_print.assert_any_call("Error: Start date must be before end date")
-        mock_exit.assert_called_with(1)
+
+        self.assertEqual(exc_info.value.code, 1)
+        self.assertIn("Error: Start date must be before end date", self.capsys.readouterr().out)
 
 
-if __name__ == '__main__':
-    loader = unittest.TestLoader()
-    suite = unittest.TestSuite()
-    
-    # Add test classes
-    suite.addTests(loader.loadTestsFromTestCase(TestGitCommitRewriter))
-    suite.addTests(loader.loadTestsFromTestCase(TestGitCommitRewriterMethods))
-    suite.addTests(loader.loadTestsFromTestCase(TestGitCommitRewriterIntegration))
-    suite.addTests(loader.loadTestsFromTestCase(TestMainFunction))
-    
-    # Run tests
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
-    
-    # Exit with non-zero code if tests failed
-    if not result.wasSuccessful():
-        sys.exit(1)